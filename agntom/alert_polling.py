@@ -0,0 +1,285 @@
+import logging
+import math
+import queue
+import threading
+import time
+from collections import namedtuple
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from dateutil.parser import parse
+from django.utils import timezone
+from tom_alerts.alerts import get_service_class
+from tom_alerts.models import BrokerQuery
+from tom_targets.models import Target, TargetName
+
+from agntom.sky_index import angular_separation, crossmatch
+from agntom.utils import get_settings_dict
+
+logger = logging.getLogger(__name__)
+
+# Values given in settings.ALERT_POLLING override these
+DEFAULT_ALERT_POLLING = {
+    'timeout': 120,
+    'max_workers': None,
+    'match_radius_arcsec': 2.0,
+    'match_window_hours': 24.0,
+    'cursor_overlap_hours': 6.0,
+}
+
+PolledAlert = namedtuple('PolledAlert', ['broker', 'alert', 'generic_alert', 'timestamp'])
+
+
+def alert_timestamp(generic_alert):
+    """Function to return the timestamp of a GenericAlert as a timezone-aware
+    datetime, or None if the broker did not provide a usable one"""
+
+    timestamp = generic_alert.timestamp
+    if isinstance(timestamp, str):
+        try:
+            timestamp = parse(timestamp)
+        except (ValueError, OverflowError):
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    if timezone.is_naive(timestamp):
+        timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+
+    return timestamp
+
+
+def fetch_query_alerts(query, cursor=None):
+    """Function to run a single BrokerQuery and return the alerts it produces
+    that are newer than the cursor.  This is run in a worker thread, so it
+    must not touch the database."""
+
+    broker = get_service_class(query.broker)()
+    # Some brokers modify the parameters in place, and some return a tuple
+    # of (alerts, broker_feedback) rather than just the alerts
+    alerts = broker.fetch_alerts(deepcopy(query.parameters))
+    if isinstance(alerts, tuple):
+        alerts, broker_feedback = alerts
+        if broker_feedback:
+            logger.info(f'Broker query {query.name} ({query.broker}): {broker_feedback}')
+    polled_alerts = []
+    for alert in alerts:
+        generic_alert = broker.to_generic_alert(alert)
+        timestamp = alert_timestamp(generic_alert)
+        if cursor and timestamp and timestamp <= cursor:
+            continue
+        polled_alerts.append(PolledAlert(broker, alert, generic_alert, timestamp))
+
+    return polled_alerts
+
+
+def deduplicate_alerts(polled_alerts, match_radius_arcsec, match_window_hours):
+    """Function to group alerts reported by different brokers for the same
+    event.  Alerts are considered duplicates if they lie within
+    match_radius_arcsec of each other and, where both have timestamps, within
+    match_window_hours.
+
+    Alerts are bucketed in declination stripes one match radius wide, so each
+    alert is only compared against those in its own and neighbouring stripes.
+    Returns a list of groups; the first alert in each group is the one which
+    will be ingested.
+    """
+
+    radius = match_radius_arcsec / 3600.0
+    window = timedelta(hours=match_window_hours)
+    stripes = {}
+    groups = []
+
+    for polled_alert in polled_alerts:
+        ra = polled_alert.generic_alert.ra
+        dec = polled_alert.generic_alert.dec
+        if ra is None or dec is None:
+            groups.append([polled_alert])
+            continue
+
+        stripe = int(math.floor(dec / radius))
+        match = None
+        for neighbour in (stripe - 1, stripe, stripe + 1):
+            for group in stripes.get(neighbour, []):
+                primary = group[0]
+                if angular_separation(ra, dec, primary.generic_alert.ra, primary.generic_alert.dec) > radius:
+                    continue
+                if polled_alert.timestamp and primary.timestamp \
+                        and abs(polled_alert.timestamp - primary.timestamp) > window:
+                    continue
+                match = group
+                break
+            if match:
+                break
+
+        if match:
+            match.append(polled_alert)
+        else:
+            group = [polled_alert]
+            groups.append(group)
+            stripes.setdefault(stripe, []).append(group)
+
+    return groups
+
+
+def ingest_alert_groups(groups, match_radius_arcsec):
+    """Function to create Targets for groups of duplicate alerts, skipping any
+    group where one of the alert names is already known to the TOM.
+
+    The first alert of each remaining group is crossmatched against the
+    existing Targets, and where one lies within match_radius_arcsec the alert
+    names are added to it as aliases rather than creating a new Target.
+    Otherwise the names of the other alerts in a group are stored as aliases
+    of the new Target.  Returns the lists of Targets created and matched.
+    """
+
+    names = {polled_alert.generic_alert.name for group in groups for polled_alert in group}
+    known_names = set(Target.objects.filter(name__in=names).values_list('name', flat=True))
+    known_names |= set(TargetName.objects.filter(name__in=names).values_list('name', flat=True))
+
+    groups = [group for group in groups
+              if not known_names.intersection(polled_alert.generic_alert.name for polled_alert in group)]
+    positioned = [group for group in groups
+                  if group[0].generic_alert.ra is not None and group[0].generic_alert.dec is not None]
+    matches = crossmatch([(group[0].generic_alert.ra, group[0].generic_alert.dec) for group in positioned],
+                         match_radius_arcsec / 3600.0)
+    group_matches = {id(group): match for group, match in zip(positioned, matches)}
+
+    new_targets = []
+    matched_targets = []
+    for group in groups:
+        group_names = [polled_alert.generic_alert.name for polled_alert in group]
+        known_names.update(group_names)
+
+        if group_matches.get(id(group)):
+            target_id, separation = group_matches[id(group)][0]
+            target = Target.objects.get(pk=target_id)
+            for name in group_names:
+                TargetName.objects.create(target=target, name=name)
+            logger.info(f'Alerts {", ".join(group_names)} matched target {target.name} '
+                        f'at {separation * 3600.0:.2f} arcsec')
+            matched_targets.append(target)
+            continue
+
+        # The brokers' own to_target() either saves the Target itself or
+        # returns nothing, so it is built from the GenericAlert as
+        # tom_alerts' CreateTargetFromAlertView does
+        primary = group[0]
+        target, extras, aliases = primary.generic_alert.to_target()
+        aliases = list(aliases)
+        for name in group_names[1:]:
+            if name != target.name and name not in aliases:
+                aliases.append(name)
+        target.save(extras=extras, names=aliases)
+        new_targets.append(target)
+
+    return new_targets, matched_targets
+
+
+def run_queries(queries, cursors, timeout, max_workers=None):
+    """Function to run BrokerQueries concurrently, each in its own daemon
+    thread, with at most max_workers running at once.
+
+    Each query is given timeout seconds from when it starts.  A query which
+    overruns is abandoned: its thread is left to finish in the background,
+    and as it is a daemon thread it does not hold up the exit of the process.
+    Returns a dictionary of the alerts or exception produced by each query
+    index, and the list of indices of the queries which timed out.
+    """
+
+    max_workers = max_workers or len(queries)
+    results = {}
+    finished = queue.Queue()
+
+    def run_query(index):
+        try:
+            results[index] = fetch_query_alerts(queries[index], cursors[index])
+        except Exception as e:
+            results[index] = e
+        finished.put(index)
+
+    pending = list(range(len(queries)))
+    running = {}
+    timed_out = []
+    while pending or running:
+        while pending and len(running) < max_workers:
+            index = pending.pop(0)
+            threading.Thread(target=run_query, args=(index,), daemon=True).start()
+            running[index] = time.monotonic() + timeout
+
+        try:
+            index = finished.get(timeout=max(0.0, min(running.values()) - time.monotonic()))
+            running.pop(index, None)
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        for index, deadline in list(running.items()):
+            if deadline <= now:
+                timed_out.append(index)
+                del running[index]
+
+    return {index: result for index, result in results.items() if index not in timed_out}, timed_out
+
+
+def poll_brokers(queries=None, timeout=None, max_workers=None):
+    """Function to run all saved BrokerQueries concurrently and ingest the
+    new alerts they return.
+
+    Each query only considers alerts newer than its last_run, less a small
+    overlap to catch alerts which were published late.  Queries which do not
+    complete within timeout seconds of starting are abandoned for this sweep,
+    and their cursor is left unchanged so that they are retried in full next
+    time.  Alerts are deduplicated across brokers, and crossmatched against
+    the existing Targets, before any Targets are created.
+    """
+
+    params = get_settings_dict('ALERT_POLLING', DEFAULT_ALERT_POLLING)
+    if timeout is None:
+        timeout = params['timeout']
+    if max_workers is None:
+        max_workers = params['max_workers']
+    if queries is None:
+        queries = BrokerQuery.objects.all()
+    queries = list(queries)
+    if not queries:
+        return {'completed': [], 'failed': [], 'timed_out': [], 'alerts': 0, 'targets': [], 'matched': []}
+
+    overlap = timedelta(hours=params['cursor_overlap_hours'])
+    sweep_start = timezone.now()
+
+    cursors = [query.last_run - overlap if query.last_run else None for query in queries]
+    results, timed_out = run_queries(queries, cursors, timeout, max_workers=max_workers)
+
+    polled_alerts = []
+    completed = []
+    failed = []
+    for index, query in enumerate(queries):
+        if index not in results:
+            continue
+        if isinstance(results[index], Exception):
+            logger.error(f'Broker query {query.name} ({query.broker}) failed: {results[index]}')
+            failed.append(query)
+            continue
+        logger.info(f'Broker query {query.name} ({query.broker}) returned {len(results[index])} new alerts')
+        polled_alerts += results[index]
+        completed.append(query)
+
+    timed_out = [queries[index] for index in timed_out]
+    for query in timed_out:
+        logger.warning(f'Broker query {query.name} ({query.broker}) did not complete within {timeout}s')
+
+    groups = deduplicate_alerts(polled_alerts, params['match_radius_arcsec'], params['match_window_hours'])
+    new_targets, matched_targets = ingest_alert_groups(groups, params['match_radius_arcsec'])
+
+    for query in completed:
+        query.last_run = sweep_start
+        query.save(update_fields=['last_run'])
+
+    return {
+        'completed': completed,
+        'failed': failed,
+        'timed_out': timed_out,
+        'alerts': len(polled_alerts),
+        'targets': new_targets,
+        'matched': matched_targets,
+    }
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class AgntomConfig(AppConfig):
+    name = 'agntom'
+
+    def ready(self):
+        import agntom.signals  # noqa
@@ -0,0 +1,273 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from tom_common.hooks import run_hook
+from tom_dataproducts.models import DataProduct, data_product_path
+from tom_observations.facility import get_service_class, get_service_classes
+from tom_observations.models import ObservationRecord
+
+from agntom.utils import get_settings_dict
+
+logger = logging.getLogger(__name__)
+
+# Values given in settings.ARCHIVE_SYNC override these
+DEFAULT_ARCHIVE_SYNC = {
+    'max_workers': 8,
+    'chunk_size': 1024 * 1024,
+    'timeout': 60,
+}
+
+LCO_ARCHIVE_URL = 'https://archive-api.lco.global'
+
+FILE_TYPES = {
+    '.fits': 'fits_file',
+    '.fits.fz': 'fits_file',
+    '.png': 'image_file',
+    '.jpg': 'image_file',
+}
+
+thread_data = threading.local()
+
+
+def get_session():
+    """Function to return a requests Session for the current thread, so that
+    each download worker reuses its connections to the archive"""
+
+    if not hasattr(thread_data, 'session'):
+        thread_data.session = requests.Session()
+
+    return thread_data.session
+
+
+def file_md5(file_path, chunk_size=1024 * 1024):
+    """Function to calculate the MD5 checksum of a file, reading it in chunks"""
+
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def product_checksum(product):
+    """Function to return the MD5 checksum of a data product, as given by the
+    facility archive, or None if it was not provided"""
+
+    if product.get('md5'):
+        return product['md5']
+    if product.get('version_set'):
+        return product['version_set'][0].get('md5')
+
+    return None
+
+
+def find_pending_records(facility=None):
+    """Function to return the ObservationRecords which completed successfully
+    but do not yet have any DataProducts.  Facilities which do not report
+    which of their terminal states are failures are skipped, as there is no
+    way to tell whether their observations produced data."""
+
+    pending = []
+    for name, facility_class in get_service_classes().items():
+        if facility and name != facility:
+            continue
+        facility_instance = facility_class()
+        if not hasattr(facility_instance, 'get_terminal_observing_states') \
+                or not hasattr(facility_instance, 'get_failed_observing_states'):
+            logger.debug(f'Skipping facility {name}, which does not report failed observing states')
+            continue
+        completed_states = set(facility_instance.get_terminal_observing_states()) \
+            - set(facility_instance.get_failed_observing_states())
+        pending += ObservationRecord.objects.filter(
+            facility=name,
+            status__in=completed_states,
+            dataproduct__isnull=True
+        ).select_related('target')
+
+    return pending
+
+
+def list_lco_frames(observation_id):
+    """Function to return the frames held in the LCO archive for an
+    observation request.  The archive's frames endpoint is queried directly,
+    rather than through the facility's data_products(), because it includes
+    an MD5 checksum of each frame in its version_set."""
+
+    lco_settings = settings.FACILITIES.get('LCO', {})
+    url = lco_settings.get('archive_url', LCO_ARCHIVE_URL).rstrip('/') + '/frames/'
+    headers = {'Authorization': 'Token ' + lco_settings.get('api_key', '')}
+    params = {'request_id': observation_id, 'limit': 1000}
+    timeout = get_settings_dict('ARCHIVE_SYNC', DEFAULT_ARCHIVE_SYNC)['timeout']
+
+    frames = []
+    while url:
+        response = get_session().get(url, headers=headers, params=params, timeout=timeout)
+        response.raise_for_status()
+        content = response.json()
+        frames += content['results']
+        url = content.get('next')
+        params = None
+
+    return frames
+
+
+def list_products(record):
+    """Function to return the data products available from the facility
+    archive for an ObservationRecord"""
+
+    if record.facility == 'LCO':
+        return list_lco_frames(record.observation_id)
+
+    return get_service_class(record.facility)().data_products(record.observation_id)
+
+
+def download_file(url, destination, checksum=None, chunk_size=1024 * 1024, timeout=60):
+    """Function to download a file, streaming it to disk in chunks.
+
+    If the file already exists and matches the checksum given by the archive,
+    it is not downloaded again.  Where no checksum is available, an existing
+    file of the same size as the remote one is kept.  Files are written to a
+    temporary name and moved into place once complete, so an interrupted
+    download never leaves a partial file at the destination.
+    Returns True if the file was downloaded, or False if it was skipped.
+    """
+
+    if checksum and os.path.exists(destination) and file_md5(destination, chunk_size) == checksum:
+        return False
+
+    with get_session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        size = response.headers.get('Content-Length')
+        if not checksum and size and os.path.exists(destination) \
+                and os.path.getsize(destination) == int(size):
+            return False
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        partial_file = destination + '.part'
+        md5 = hashlib.md5()
+        try:
+            with open(partial_file, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    md5.update(chunk)
+        except Exception:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise
+
+    if checksum and md5.hexdigest() != checksum:
+        os.remove(partial_file)
+        raise IOError(f'Checksum mismatch downloading {url}')
+    os.replace(partial_file, destination)
+
+    return True
+
+
+def data_product_type(filename):
+    """Function to return the DATA_PRODUCT_TYPES key for a file, based on its
+    extension, or an empty string if it is not recognised"""
+
+    for extension, product_type in FILE_TYPES.items():
+        if filename.lower().endswith(extension) and product_type in settings.DATA_PRODUCT_TYPES:
+            return product_type
+
+    return ''
+
+
+def sync_archive_data(facility=None, max_workers=None):
+    """Function to download the data of completed ObservationRecords which do
+    not yet have DataProducts, and register them in bulk.
+
+    Archive listings and file downloads are both run in a bounded thread
+    pool.  DataProducts are only created for a record once all of its files
+    are on disk, so a record with a failed download is picked up again by the
+    next sync, which skips the files it already has.
+    """
+
+    params = get_settings_dict('ARCHIVE_SYNC', DEFAULT_ARCHIVE_SYNC)
+    if max_workers is None:
+        max_workers = params['max_workers']
+
+    records = find_pending_records(facility=facility)
+    summary = {'records': len(records), 'downloaded': 0, 'skipped': 0, 'failed': 0, 'data_products': 0}
+    if not records:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listing_futures = [(record, executor.submit(list_products, record)) for record in records]
+
+        download_futures = {}
+        for record, future in listing_futures:
+            try:
+                products = future.result()
+            except Exception as e:
+                logger.error(f'Could not list data for observation {record.observation_id}: {e}')
+                summary['failed'] += 1
+                continue
+
+            download_futures[record] = []
+            for product in products:
+                data_product = DataProduct(
+                    product_id=str(product['id']),
+                    target=record.target,
+                    observation_record=record,
+                    data_product_type=data_product_type(product['filename'])
+                )
+                data_product.data = data_product_path(data_product, product['filename'])
+                destination = os.path.join(settings.MEDIA_ROOT, data_product.data.name)
+                future = executor.submit(download_file, product['url'], destination,
+                                         checksum=product_checksum(product),
+                                         chunk_size=params['chunk_size'], timeout=params['timeout'])
+                download_futures[record].append((data_product, future))
+
+        new_products = []
+        for record, downloads in download_futures.items():
+            complete = True
+            for data_product, future in downloads:
+                try:
+                    downloaded = future.result()
+                except Exception as e:
+                    logger.error(f'Could not download {data_product.product_id} '
+                                 f'for observation {record.observation_id}: {e}')
+                    summary['failed'] += 1
+                    complete = False
+                    continue
+                summary['downloaded' if downloaded else 'skipped'] += 1
+            if complete:
+                new_products += [data_product for data_product, future in downloads]
+
+    summary['data_products'] = register_data_products(new_products)
+
+    return summary
+
+
+def register_data_products(data_products, batch_size=500):
+    """Function to create DataProducts in bulk, and run the
+    data_product_post_save hook for each of them, as DataProduct.save()
+    would.  Any whose product_id is already registered are logged and left
+    out.  Returns the number of DataProducts created."""
+
+    created = 0
+    for i in range(0, len(data_products), batch_size):
+        batch = data_products[i:i + batch_size]
+        product_ids = [data_product.product_id for data_product in batch]
+        existing = set(DataProduct.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+        for product_id in existing:
+            logger.warning(f'Data product {product_id} is already registered, and was not added again')
+        batch = [data_product for data_product in batch if data_product.product_id not in existing]
+
+        DataProduct.objects.bulk_create(batch)
+        created += len(batch)
+
+        # bulk_create does not call save(), and does not return primary keys
+        # on every database, so the hook is run on the saved DataProducts
+        for data_product in DataProduct.objects.filter(product_id__in=[dp.product_id for dp in batch]):
+            run_hook('data_product_post_save', data_product)
+
+    return created
@@ -0,0 +1,30 @@
+from django.db.models import Q
+from tom_targets.filters import TargetFilter
+from tom_targets.models import Target
+
+from agntom.sky_index import cone_search
+
+
+class SkyIndexTargetFilter(TargetFilter):
+    """
+    TargetFilter which answers cone searches from the TargetSkyIndex,
+    rather than computing the separation of every Target in the database
+    """
+
+    def filter_cone_search(self, queryset, name, value):
+        if name == 'cone_search':
+            ra, dec, radius = value.split(',')
+        elif name == 'target_cone_search':
+            target_name, radius = value.split(',')
+            targets = Target.objects.filter(
+                Q(name__icontains=target_name) | Q(aliases__name__icontains=target_name)
+            ).distinct()
+            if len(targets) != 1 or targets[0].ra is None or targets[0].dec is None:
+                return queryset.none()
+            ra = targets[0].ra
+            dec = targets[0].dec
+        else:
+            return super().filter_cone_search(queryset, name, value)
+
+        # cone_search returns a subquery, so the matches stay in the database
+        return queryset.filter(pk__in=cone_search(float(ra), float(dec), float(radius)))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from agntom.alert_polling import poll_brokers
+
+
+class Command(BaseCommand):
+
+    help = 'Runs all saved broker queries concurrently and ingests new alerts as Targets, ' \
+           'deduplicating alerts reported by more than one broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, help='Seconds to wait for each broker before abandoning it')
+        parser.add_argument('--max-workers', type=int, help='Maximum number of brokers to query at once')
+
+    def handle(self, *args, **options):
+        summary = poll_brokers(timeout=options['timeout'], max_workers=options['max_workers'])
+
+        self.stdout.write(
+            f"Polled {len(summary['completed'])} broker queries, {summary['alerts']} new alerts, "
+            f"{len(summary['targets'])} new targets, {len(summary['matched'])} matched to existing targets"
+        )
+        for query in summary['failed']:
+            self.stdout.write(f'Query failed: {query.name} ({query.broker})')
+        for query in summary['timed_out']:
+            self.stdout.write(f'Query timed out: {query.name} ({query.broker})')
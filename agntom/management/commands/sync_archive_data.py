@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from agntom.archive_sync import sync_archive_data
+
+
+class Command(BaseCommand):
+
+    help = 'Downloads the data of completed observations which do not yet have data products, ' \
+           'and registers them as DataProducts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facility', help='Only sync observations from this facility')
+        parser.add_argument('--max-workers', type=int, help='Maximum number of concurrent downloads')
+
+    def handle(self, *args, **options):
+        summary = sync_archive_data(facility=options['facility'], max_workers=options['max_workers'])
+
+        self.stdout.write(
+            f"Synced {summary['records']} observations: {summary['downloaded']} files downloaded, "
+            f"{summary['skipped']} already present, {summary['failed']} failed, "
+            f"{summary['data_products']} data products registered"
+        )
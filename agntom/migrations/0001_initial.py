@@ -0,0 +1,46 @@
+import math
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Must match agntom.sky_index.ZONE_HEIGHT at the time of this migration
+ZONE_HEIGHT = 0.1
+
+
+def populate_sky_index(apps, schema_editor):
+    Target = apps.get_model('tom_targets', 'Target')
+    TargetSkyIndex = apps.get_model('agntom', 'TargetSkyIndex')
+
+    targets = Target.objects.filter(ra__isnull=False, dec__isnull=False).values_list('id', 'ra', 'dec')
+    TargetSkyIndex.objects.bulk_create(
+        [TargetSkyIndex(target_id=target_id, zone=int(math.floor((dec + 90.0) / ZONE_HEIGHT)), ra=ra % 360.0, dec=dec)
+         for target_id, ra, dec in targets.iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('tom_targets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetSkyIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zone', models.IntegerField()),
+                ('ra', models.FloatField()),
+                ('dec', models.FloatField()),
+                ('target', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                related_name='sky_index', to='tom_targets.target')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['zone', 'ra'], name='agntom_sky_zone_ra_idx')],
+            },
+        ),
+        migrations.RunPython(populate_sky_index, migrations.RunPython.noop),
+    ]
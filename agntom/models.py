@@ -0,0 +1,24 @@
+from django.db import models
+from tom_targets.models import Target
+
+
+class TargetSkyIndex(models.Model):
+    """
+    Positional index of sidereal Targets, used for fast cone searches and
+    crossmatching.  The sky is divided into declination zones of fixed
+    height, and the index is ordered by zone and RA, so that a positional
+    query only reads the rows in a small box around each position.  Rows are
+    kept current by a post_save signal receiver on Target.
+    """
+    target = models.OneToOneField(Target, on_delete=models.CASCADE, related_name='sky_index')
+    zone = models.IntegerField()
+    ra = models.FloatField()
+    dec = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['zone', 'ra'], name='agntom_sky_zone_ra_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.target} (zone {self.zone})'
@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     'tom_catalogs',
     'tom_observations',
     'tom_dataproducts',
+    'agntom',
 ]
 
 SITE_ID = 1
@@ -193,7 +194,9 @@ TARGET_TYPE = 'SIDEREAL'
 
 FACILITIES = {
     'LCO': {
-        'portal_url': 'https://observe.lco.global',
+        # Set LCO_PORTAL_URL to use a local stand-in portal such as
+        # agntom/toolbox/fake_lco.py for offline testing
+        'portal_url': os.getenv('LCO_PORTAL_URL', 'https://observe.lco.global'),
         'api_key': os.environ['LCO_API_KEY'],
     },
     'GEM': {
@@ -228,6 +231,13 @@ DATA_PRODUCT_TYPES = {
     'image_file': ('image_file', 'Image File')
 }
 
+# Settings for the sync_archive_data command, which downloads the data of
+# completed observations.  max_workers sets the number of concurrent
+# downloads, and files are streamed to MEDIA_ROOT in chunks of chunk_size bytes.
+# The defaults are in agntom.archive_sync.DEFAULT_ARCHIVE_SYNC, and only the
+# values to be changed need to be given here.
+ARCHIVE_SYNC = {}
+
 DATA_PROCESSORS = {
     'photometry': 'tom_dataproducts.processors.photometry_processor.PhotometryProcessor',
     'spectroscopy': 'tom_dataproducts.processors.spectroscopy_processor.SpectroscopyProcessor',
@@ -260,6 +270,14 @@ BROKERS = {
     }
 }
 
+# Settings for the poll_alert_brokers command, which runs all saved broker
+# queries concurrently.  Brokers which take longer than timeout seconds are
+# skipped for that sweep.  Alerts from different brokers within
+# match_radius_arcsec and match_window_hours of each other are treated as
+# the same event.  The defaults are in agntom.alert_polling.DEFAULT_ALERT_POLLING,
+# and only the values to be changed need to be given here.
+ALERT_POLLING = {}
+
 TOM_HARVESTER_CLASSES = [
     'tom_catalogs.harvesters.simbad.SimbadHarvester',
     'tom_catalogs.harvesters.ned.NEDHarvester',
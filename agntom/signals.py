@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from tom_targets.models import Target
+
+from agntom.sky_index import update_sky_index
+
+
+@receiver(post_save, sender=Target)
+def target_post_save(sender, instance, **kwargs):
+    """Keeps the positional index of a Target current whenever it is saved,
+    however it was created.  Index rows are removed with their Target by
+    the cascading delete."""
+
+    update_sky_index(instance)
@@ -0,0 +1,164 @@
+import math
+from bisect import bisect_left, bisect_right
+
+from django.db.models import Q, Value
+from django.db.models.functions import Cos, Power, Radians, Sin
+
+from agntom.models import TargetSkyIndex
+
+# Height of each declination zone in degrees.  Changing this requires the
+# TargetSkyIndex to be rebuilt.
+ZONE_HEIGHT = 0.1
+
+# Crossmatches touching more zones than this read the whole index, rather
+# than passing a very long list of zones to the database
+MAX_QUERY_ZONES = 500
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """Function to calculate the angular separation in degrees between two
+    positions given in decimal degrees, using the haversine formula"""
+
+    ra1, dec1, ra2, dec2 = map(math.radians, (ra1, dec1, ra2, dec2))
+    hav = math.sin((dec2 - dec1) / 2.0)**2 \
+        + math.cos(dec1) * math.cos(dec2) * math.sin((ra2 - ra1) / 2.0)**2
+
+    return math.degrees(2.0 * math.asin(min(1.0, math.sqrt(hav))))
+
+
+def get_zone(dec):
+    """Function to return the declination zone containing dec"""
+
+    return int(math.floor((min(max(dec, -90.0), 90.0) + 90.0) / ZONE_HEIGHT))
+
+
+def zone_range(dec, radius):
+    """Function to return the zones overlapping a cone of the given radius,
+    in degrees, around dec"""
+
+    return range(get_zone(dec - radius), get_zone(dec + radius) + 1)
+
+
+def ra_half_width(dec, radius):
+    """Function to return the half-width in RA of the box which encloses a
+    cone of the given radius around dec, following Gray et al. (2006) 'There
+    Goes the Neighborhood: Relational Algebra for Spatial Data Search'.
+    Returns 180 if the cone contains a pole."""
+
+    if abs(dec) + radius >= 89.99:
+        return 180.0
+    cos_product = math.cos(math.radians(dec - radius)) * math.cos(math.radians(dec + radius))
+    alpha = math.atan(math.sin(math.radians(radius)) / math.sqrt(abs(cos_product)))
+
+    return min(math.degrees(abs(alpha)), 180.0)
+
+
+def ra_ranges(ra, dec, radius):
+    """Function to return the list of (min, max) RA ranges, in the range
+    0-360, which enclose a cone, splitting the box where it crosses RA=0"""
+
+    ra = ra % 360.0
+    alpha = ra_half_width(dec, radius)
+    if alpha >= 180.0:
+        return [(0.0, 360.0)]
+    ra_min = ra - alpha
+    ra_max = ra + alpha
+    if ra_min < 0.0:
+        return [(ra_min + 360.0, 360.0), (0.0, ra_max)]
+    if ra_max >= 360.0:
+        return [(ra_min, 360.0), (0.0, ra_max - 360.0)]
+
+    return [(ra_min, ra_max)]
+
+
+def update_sky_index(target):
+    """Function to add, update or remove the TargetSkyIndex entry of a Target"""
+
+    if target.ra is None or target.dec is None:
+        TargetSkyIndex.objects.filter(target=target).delete()
+        return
+
+    TargetSkyIndex.objects.update_or_create(
+        target=target,
+        defaults={'zone': get_zone(target.dec), 'ra': target.ra % 360.0, 'dec': target.dec}
+    )
+
+
+def cone_search(ra, dec, radius, targets=None):
+    """Function to return a queryset of the IDs of the Targets within radius
+    degrees of (ra, dec), optionally restricted to the given queryset of
+    Targets.
+
+    The zone and RA range which enclose the cone select a small set of
+    candidates from the index, and the exact separation of these is then
+    checked by the database, so the result can be used as a subquery.
+    """
+
+    ra_query = Q()
+    for ra_min, ra_max in ra_ranges(ra, dec, radius):
+        ra_query |= Q(ra__gte=ra_min, ra__lte=ra_max)
+
+    # Haversine of the separation, compared against that of the radius
+    dec_rad = math.radians(dec)
+    haversine = Power(Sin((Radians('dec') - dec_rad) / 2.0), 2) \
+        + Value(math.cos(dec_rad)) * Cos(Radians('dec')) * Power(Sin((Radians('ra') - math.radians(ra)) / 2.0), 2)
+
+    zones = zone_range(dec, radius)
+    candidates = TargetSkyIndex.objects.filter(
+        ra_query,
+        zone__range=(zones[0], zones[-1]),
+        dec__gte=dec - radius,
+        dec__lte=dec + radius,
+    ).annotate(haversine=haversine).filter(haversine__lte=math.sin(math.radians(radius) / 2.0)**2)
+    if targets is not None:
+        candidates = candidates.filter(target__in=targets)
+
+    return candidates.values_list('target_id', flat=True)
+
+
+def crossmatch(positions, radius, targets=None):
+    """Function to crossmatch a list of (ra, dec) positions against the
+    target catalogue in a single pass.
+
+    The index rows for all of the zones touched by the positions are read
+    once and held in memory, sorted by RA within each zone, so that each
+    position is matched with a binary search rather than a database query.
+    Returns, for each position, a list of (target_id, separation) tuples
+    ordered by separation, where separation is in degrees.
+    """
+
+    zones = set()
+    for ra, dec in positions:
+        zones.update(zone_range(dec, radius))
+
+    rows = TargetSkyIndex.objects.all()
+    if len(zones) <= MAX_QUERY_ZONES:
+        rows = rows.filter(zone__in=zones)
+    if targets is not None:
+        rows = rows.filter(target__in=targets)
+
+    zone_rows = {}
+    for zone, target_ra, target_dec, target_id in rows.values_list('zone', 'ra', 'dec', 'target_id').iterator():
+        zone_rows.setdefault(zone, []).append((target_ra, target_dec, target_id))
+    zone_ras = {}
+    for zone, entries in zone_rows.items():
+        entries.sort()
+        zone_ras[zone] = [entry[0] for entry in entries]
+
+    results = []
+    for ra, dec in positions:
+        matches = []
+        for zone in zone_range(dec, radius):
+            if zone not in zone_rows:
+                continue
+            for ra_min, ra_max in ra_ranges(ra, dec, radius):
+                start = bisect_left(zone_ras[zone], ra_min)
+                end = bisect_right(zone_ras[zone], ra_max)
+                for target_ra, target_dec, target_id in zone_rows[zone][start:end]:
+                    separation = angular_separation(ra, dec, target_ra, target_dec)
+                    if separation <= radius:
+                        matches.append((target_id, separation))
+        matches.sort(key=lambda match: match[1])
+        results.append(matches)
+
+    return results
@@ -0,0 +1,450 @@
+"""
+Local stand-in for the LCO observe portal, for load-testing observation
+submission and status synchronisation without touching the live network.
+
+It implements the parts of the portal API used by the TOM's LCO facility and
+by lco.py:
+    POST /api/requestgroups/                Submit a RequestGroup
+    POST /api/requestgroups/validate/       Validate a RequestGroup
+    GET  /api/requestgroups/                List RequestGroups
+    GET  /api/requestgroups/<id>/           RequestGroup details
+    POST /api/requestgroups/<id>/cancel/    Cancel a RequestGroup
+    GET  /api/requests/<id>/                Request status
+    GET  /api/requests/<id>/observations/   Observations of a Request
+    GET  /api/instruments/                  Instrument metadata
+    GET  /api/proposals/                    Proposals
+    GET  /api/profile/                      User profile and proposals
+
+To point the TOM at a running instance, set the LCO_PORTAL_URL environment
+variable used by FACILITIES['LCO']['portal_url'], e.g.
+    python fake_lco.py --port 8001 --latency 0.2 --error-rate 0.05
+    LCO_PORTAL_URL=http://127.0.0.1:8001 python manage.py runcadencestrategies
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CONFIGURATION_TYPES = {
+    'EXPOSE': {'name': 'Exposure', 'code': 'EXPOSE', 'schedulable': True, 'config_change_overhead': 0.0,
+               'force_acquisition_off': False, 'requires_optical_elements': True, 'validation_schema': {}},
+    'REPEAT_EXPOSE': {'name': 'Exposure Sequence', 'code': 'REPEAT_EXPOSE', 'schedulable': True,
+                      'config_change_overhead': 0.0, 'force_acquisition_off': False,
+                      'requires_optical_elements': True, 'validation_schema': {}},
+    'SPECTRUM': {'name': 'Spectrum', 'code': 'SPECTRUM', 'schedulable': True, 'config_change_overhead': 0.0,
+                 'force_acquisition_off': False, 'requires_optical_elements': True, 'validation_schema': {}},
+    'ARC': {'name': 'Arc', 'code': 'ARC', 'schedulable': True, 'config_change_overhead': 0.0,
+            'force_acquisition_off': True, 'requires_optical_elements': True, 'validation_schema': {}},
+    'LAMP_FLAT': {'name': 'Lamp Flat', 'code': 'LAMP_FLAT', 'schedulable': True, 'config_change_overhead': 0.0,
+                  'force_acquisition_off': True, 'requires_optical_elements': True, 'validation_schema': {}},
+}
+
+
+def instrument_modes(readout_code, readout_name, acquisition_codes):
+    """Function to return the modes of an instrument, in the format of the
+    portal's instruments endpoint"""
+
+    def mode(code, name):
+        return {'name': name, 'code': code, 'overhead': 0.0, 'schedulable': True, 'validation_schema': {}}
+
+    return {
+        'guiding': {'type': 'guiding', 'default': 'ON',
+                    'modes': [mode('ON', 'On'), mode('OFF', 'Off'), mode('OPTIONAL', 'Optional')]},
+        'acquisition': {'type': 'acquisition', 'default': acquisition_codes[0],
+                        'modes': [mode(code, code.title()) for code in acquisition_codes]},
+        'readout': {'type': 'readout', 'default': readout_code, 'modes': [mode(readout_code, readout_name)]},
+        'rotator': {'type': 'rotator', 'default': 'SKY', 'modes': [mode('SKY', 'Sky')]},
+    }
+
+
+INSTRUMENTS = {
+    '1M0-SCICAM-SINISTRO': {
+        'type': 'IMAGE',
+        'class': '1m0',
+        'name': '1.0 meter Sinistro',
+        'optical_elements': {
+            'filters': [{'name': 'Bessell-B', 'code': 'B', 'schedulable': True, 'default': False},
+                        {'name': 'Bessell-V', 'code': 'V', 'schedulable': True, 'default': True},
+                        {'name': 'Bessell-I', 'code': 'I', 'schedulable': True, 'default': False},
+                        {'name': 'SDSS-gp', 'code': 'gp', 'schedulable': True, 'default': False},
+                        {'name': 'SDSS-rp', 'code': 'rp', 'schedulable': True, 'default': False},
+                        {'name': 'SDSS-ip', 'code': 'ip', 'schedulable': True, 'default': False}]
+        },
+        'modes': instrument_modes('full_frame', 'Sinistro 1x1', ['OFF']),
+        'default_acceptability_threshold': 90.0,
+        'default_configuration_type': 'EXPOSE',
+        'configuration_types': {code: CONFIGURATION_TYPES[code] for code in ('EXPOSE', 'REPEAT_EXPOSE')},
+        'camera_type': {'science_field_of_view': 26.5, 'autoguider_field_of_view': 26.5, 'pixel_scale': 0.389,
+                        'pixels_x': 4096, 'pixels_y': 4096, 'orientation': 0.0},
+    },
+    '2M0-FLOYDS-SCICAM': {
+        'type': 'SPECTRA',
+        'class': '2m0',
+        'name': '2.0 meter FLOYDS',
+        'optical_elements': {
+            'slits': [{'name': '1.6 arcsec slit', 'code': 'slit_1.6as', 'schedulable': True, 'default': False},
+                      {'name': '2.0 arcsec slit', 'code': 'slit_2.0as', 'schedulable': True, 'default': True}]
+        },
+        'modes': instrument_modes('default', 'Default', ['WCS', 'BRIGHTEST']),
+        'default_acceptability_threshold': 90.0,
+        'default_configuration_type': 'SPECTRUM',
+        'configuration_types': {code: CONFIGURATION_TYPES[code] for code in ('SPECTRUM', 'ARC', 'LAMP_FLAT')},
+        'camera_type': {'science_field_of_view': 4.0, 'autoguider_field_of_view': 4.0, 'pixel_scale': 0.337,
+                        'pixels_x': 2048, 'pixels_y': 512, 'orientation': 0.0},
+    },
+}
+
+PROPOSALS = [
+    {'id': 'LCOSchedulerTest', 'title': 'LCO Scheduler Test', 'current': True},
+]
+
+
+class FakeLCOPortal:
+    """
+    In-memory state and fault-injection configuration of the fake portal.
+
+    latency:        Mean delay, in seconds, added to every response
+    jitter:         Maximum random variation, in seconds, of the latency
+    error_rate:     Fraction of requests which fail with a 500 error
+    rate_limit:     Maximum requests per second per API token, above which
+                    requests are refused with a 429 error; None for no limit
+    complete_after: Seconds after submission at which requests are reported
+                    as COMPLETED; None to leave them PENDING
+    seed:           Seed for the random number generator, so that injected
+                    latencies and errors are reproducible
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None,
+                 complete_after=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.complete_after = complete_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_groups = {}
+        self.requests = {}
+        self.next_id = 1
+        self.rate_windows = {}
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0}
+
+    def _new_id(self):
+        new_id = self.next_id
+        self.next_id += 1
+        return new_id
+
+    def inject_faults(self, token):
+        """Method to apply the configured latency, rate limit and error rate
+        to an API call.  Returns an (HTTP status, message) tuple if the call
+        should fail, or None"""
+
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            fail = self.random.random() < self.error_rate
+
+            if self.rate_limit:
+                now = time.monotonic()
+                window = [t for t in self.rate_windows.get(token, []) if now - t < 1.0]
+                limited = len(window) >= self.rate_limit
+                if not limited:
+                    window.append(now)
+                self.rate_windows[token] = window
+            else:
+                limited = False
+
+            if limited:
+                self.stats['rate_limited'] += 1
+            elif fail:
+                self.stats['errors'] += 1
+
+        time.sleep(delay)
+        if limited:
+            return 429, 'Request was throttled.'
+        if fail:
+            return 500, 'Injected server error.'
+
+        return None
+
+    def validate(self, request_group):
+        """Method to check a RequestGroup for the fields the portal requires.
+        Returns a dictionary of errors, which is empty if it is valid"""
+
+        errors = {}
+        for key in ('name', 'proposal', 'requests'):
+            if not request_group.get(key):
+                errors[key] = ['This field is required.']
+        if request_group.get('proposal') and \
+                request_group['proposal'] not in [proposal['id'] for proposal in PROPOSALS]:
+            errors['proposal'] = ['You do not belong to this proposal.']
+
+        request_errors = []
+        for request in request_group.get('requests', []):
+            error = {}
+            if not request.get('windows'):
+                error['windows'] = ['You must specify at least 1 window.']
+            for configuration in request.get('configurations', []):
+                if configuration.get('instrument_type') not in INSTRUMENTS:
+                    error['configurations'] = ['Invalid instrument type.']
+            request_errors.append(error)
+        if any(request_errors):
+            errors['requests'] = request_errors
+
+        return errors
+
+    def submit(self, request_group):
+        errors = self.validate(request_group)
+        if errors:
+            return None, errors
+
+        with self.lock:
+            created = datetime.now(timezone.utc)
+            group = dict(request_group)
+            group['id'] = self._new_id()
+            group['created'] = created.isoformat()
+            group['state'] = 'PENDING'
+            group['requests'] = []
+            for request in request_group['requests']:
+                request = dict(request)
+                request['id'] = self._new_id()
+                request['request_group_id'] = group['id']
+                request['created'] = created.isoformat()
+                request['state'] = 'PENDING'
+                self.requests[request['id']] = request
+                group['requests'].append(request)
+            self.request_groups[group['id']] = group
+
+        return self.get_request_group(group['id']), None
+
+    def _request_state(self, request):
+        if request['state'] != 'PENDING' or self.complete_after is None:
+            return request['state']
+        created = datetime.fromisoformat(request['created'])
+        if datetime.now(timezone.utc) - created >= timedelta(seconds=self.complete_after):
+            return 'COMPLETED'
+        return 'PENDING'
+
+    def get_request(self, request_id):
+        request = self.requests.get(request_id)
+        if request is None:
+            return None
+        request = dict(request)
+        request['state'] = self._request_state(request)
+        return request
+
+    def get_request_group(self, group_id):
+        group = self.request_groups.get(group_id)
+        if group is None:
+            return None
+        group = dict(group)
+        group['requests'] = [self.get_request(request['id']) for request in group['requests']]
+        states = {request['state'] for request in group['requests']}
+        if group['state'] == 'PENDING' and states == {'COMPLETED'}:
+            group['state'] = 'COMPLETED'
+        return group
+
+    def list_request_groups(self, filters):
+        groups = [self.get_request_group(group_id) for group_id in sorted(self.request_groups, reverse=True)]
+        for key in ('state', 'name', 'proposal'):
+            if key in filters:
+                groups = [group for group in groups if group.get(key) == filters[key]]
+        if 'request_id' in filters:
+            groups = [group for group in groups
+                      if int(filters['request_id']) in [request['id'] for request in group['requests']]]
+        return groups
+
+    def cancel(self, group_id):
+        with self.lock:
+            group = self.request_groups.get(group_id)
+            if group is None:
+                return None
+            group['state'] = 'CANCELED'
+            for request in group['requests']:
+                if self._request_state(request) == 'PENDING':
+                    request['state'] = 'CANCELED'
+                    self.requests[request['id']]['state'] = 'CANCELED'
+        return self.get_request_group(group_id)
+
+    def get_observations(self, request_id):
+        request = self.get_request(request_id)
+        if request is None:
+            return None
+        if request['state'] not in ('PENDING', 'COMPLETED'):
+            return []
+        window = request['windows'][0] if request.get('windows') else {}
+        return [{
+            'id': request_id,
+            'request': {'id': request_id},
+            'state': request['state'],
+            'start': window.get('start'),
+            'end': window.get('end'),
+            'site': 'tst',
+            'enclosure': 'doma',
+            'telescope': '1m0a',
+        }]
+
+
+def paginate(results, query):
+    """Function to return a list of results in the portal's paginated format"""
+
+    limit = int(query.get('limit', 10))
+    offset = int(query.get('offset', 0))
+
+    return {
+        'count': len(results),
+        'next': None if offset + limit >= len(results) else f'?limit={limit}&offset={offset + limit}',
+        'previous': None if offset == 0 else f'?limit={limit}&offset={max(0, offset - limit)}',
+        'results': results[offset:offset + limit],
+    }
+
+
+def make_handler(portal):
+    """Function to return an HTTP request handler class bound to a
+    FakeLCOPortal instance"""
+
+    class FakeLCOHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(content)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length', 0))
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def dispatch(self, method):
+            token = self.headers.get('Authorization', '')
+            if not token.startswith('Token '):
+                self.send_json(401, {'detail': 'Authentication credentials were not provided.'})
+                return
+
+            fault = portal.inject_faults(token)
+            if fault:
+                self.send_json(fault[0], {'detail': fault[1]})
+                return
+
+            url = urlparse(self.path)
+            path = url.path.rstrip('/') + '/'
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+            try:
+                status, body = self.route(method, path, query)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                status, body = 400, {'detail': str(e)}
+            self.send_json(status, body)
+
+        def route(self, method, path, query):
+            not_found = (404, {'detail': 'Not found.'})
+
+            if method == 'POST' and path == '/api/requestgroups/':
+                group, errors = portal.submit(self.read_json())
+                return (400, errors) if errors else (201, group)
+            if method == 'POST' and path == '/api/requestgroups/validate/':
+                errors = portal.validate(self.read_json())
+                return 200, {'request_durations': {}, 'errors': errors}
+            if method == 'GET' and path == '/api/requestgroups/':
+                return 200, paginate(portal.list_request_groups(query), query)
+
+            match = re.fullmatch(r'/api/requestgroups/(\d+)/(cancel/)?', path)
+            if match:
+                if method == 'POST' and match.group(2):
+                    group = portal.cancel(int(match.group(1)))
+                elif method == 'GET' and not match.group(2):
+                    group = portal.get_request_group(int(match.group(1)))
+                else:
+                    return not_found
+                return (200, group) if group else not_found
+
+            match = re.fullmatch(r'/api/requests/(\d+)/(observations/)?', path)
+            if match and method == 'GET':
+                if match.group(2):
+                    result = portal.get_observations(int(match.group(1)))
+                else:
+                    result = portal.get_request(int(match.group(1)))
+                return (200, result) if result is not None else not_found
+
+            if method == 'GET' and path == '/api/instruments/':
+                return 200, INSTRUMENTS
+            if method == 'GET' and path == '/api/proposals/':
+                return 200, paginate(PROPOSALS, query)
+            if method == 'GET' and path == '/api/profile/':
+                return 200, {'username': 'agntom', 'email': 'agntom@example.com', 'proposals': PROPOSALS}
+
+            return not_found
+
+        def do_GET(self):
+            self.dispatch('GET')
+
+        def do_POST(self):
+            self.dispatch('POST')
+
+    return FakeLCOHandler
+
+
+def start_fake_portal(host='127.0.0.1', port=0, **kwargs):
+    """Function to start a fake portal in a background thread.  Any keyword
+    arguments are passed to FakeLCOPortal.  Returns the server, whose
+    portal_url attribute gives the URL to use as the portal_url, and whose
+    shutdown() method stops it"""
+
+    portal = FakeLCOPortal(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(portal))
+    server.daemon_threads = True
+    server.portal = portal
+    server.portal_url = f'http://{server.server_address[0]}:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
+
+
+def run():
+
+    args = get_args()
+
+    portal = FakeLCOPortal(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           rate_limit=args.rate_limit, complete_after=args.complete_after, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(portal))
+    server.daemon_threads = True
+    print('Fake LCO portal running at http://' + args.host + ':' + str(args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(portal.stats)
+
+def get_args():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host address to serve on')
+    parser.add_argument('--port', type=int, default=8001, help='Port to serve on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random variation of the latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests which fail with a 500 error')
+    parser.add_argument('--rate-limit', type=int, default=None, help='Maximum requests per second per API token')
+    parser.add_argument('--complete-after', type=float, default=None,
+                        help='Seconds after submission at which requests are reported as COMPLETED')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible fault injection')
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+    run()
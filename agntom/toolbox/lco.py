@@ -2,6 +2,8 @@ import json
 import requests
 from os import path
 
+PORTAL_URL = 'https://observe.lco.global'
+
 def lco_api(request_group, credentials, end_point):
     """Function to communicate with various APIs of the LCO network.
     ur should be a user request in the form of a Python dictionary,
@@ -11,8 +13,10 @@ def lco_api(request_group, credentials, end_point):
         "requestgroups"
     Accepted methods are:
         POST
+    The portal used can be changed from the default by adding a portal_url
+    entry to the credentials.
     """
-    PORTAL_URL = 'https://observe.lco.global/api'
+    api_url = credentials.get('portal_url', PORTAL_URL).rstrip('/') + '/api'
 
     jur = json.dumps(request_group)
 
@@ -22,7 +26,7 @@ def lco_api(request_group, credentials, end_point):
         end_point = end_point[1:]
     if end_point[-1:] != '/':
         end_point = end_point+'/'
-    url = path.join(PORTAL_URL,end_point)
+    url = path.join(api_url,end_point)
 
     response = requests.post(url, headers=headers, json=request_group).json()
 
@@ -34,6 +38,8 @@ def load_lco_info(file_path):
     {"submitter": <lco user ID>,
      "proposal_id": <proposal code>,
      "lco_token": <LCO token}
+    and may optionally include "portal_url": <URL of the observe portal>, for
+    example to submit to a local stand-in portal for testing.
     """
 
     with open(file_path,'r') as f:
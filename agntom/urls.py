@@ -14,7 +14,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path, include
+from rest_framework import routers
 
+from agntom.views import SkyIndexTargetListView, SkyIndexTargetViewSet
+
+router = routers.SimpleRouter()
+router.register(r'targets', SkyIndexTargetViewSet, 'sky-index-targets')
+
+# The target list and API are overridden ahead of tom_common.urls so that
+# cone searches use the TargetSkyIndex
 urlpatterns = [
+    path('targets/', SkyIndexTargetListView.as_view(), name='sky-index-target-list'),
+    path('api/', include(router.urls)),
     path('', include('tom_common.urls')),
 ]
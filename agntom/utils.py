@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+def get_settings_dict(name, defaults):
+    """Function to return a dictionary of configuration values, with any
+    given in the settings dictionary of the same name overriding the
+    defaults"""
+
+    params = dict(defaults)
+    params.update(getattr(settings, name, None) or {})
+
+    return params
@@ -0,0 +1,70 @@
+import math
+
+from guardian.shortcuts import get_objects_for_user
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from tom_targets.api_views import TargetViewSet
+from tom_targets.models import Target
+from tom_targets.views import TargetListView
+
+from agntom.filters import SkyIndexTargetFilter
+from agntom.sky_index import crossmatch
+
+
+class SkyIndexTargetListView(TargetListView):
+    """
+    Target list which uses the TargetSkyIndex for cone searches
+    """
+    filterset_class = SkyIndexTargetFilter
+
+
+class SkyIndexTargetViewSet(TargetViewSet):
+    """
+    Target API which uses the TargetSkyIndex for cone searches, and provides
+    a bulk crossmatch endpoint.
+
+    To crossmatch a list of positions against the target catalogue, POST to
+    /api/targets/crossmatch/ with a body of the form:
+        {"radius": <search radius in arcsec, default 2.0>,
+         "positions": [[<ra>, <dec>], ...]}
+    where RA and Dec are in decimal degrees.  The response lists the matching
+    Targets for each position, nearest first.
+    """
+    filterset_class = SkyIndexTargetFilter
+
+    @action(detail=False, methods=['post'])
+    def crossmatch(self, request):
+        try:
+            radius = float(request.data.get('radius', 2.0)) / 3600.0
+            if not math.isfinite(radius) or radius <= 0.0:
+                raise ValueError('The radius must be a positive number')
+            positions = []
+            for ra, dec in request.data['positions']:
+                ra = float(ra)
+                dec = float(dec)
+                if not math.isfinite(ra) or not math.isfinite(dec) or abs(dec) > 90.0:
+                    raise ValueError(f'Invalid position {ra}, {dec}')
+                positions.append((ra % 360.0, dec))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'detail': 'Expected a list of [ra, dec] positions in decimal degrees and a radius in arcsec'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        targets = get_objects_for_user(request.user, f'{Target._meta.app_label}.view_target')
+        matches = crossmatch(positions, radius, targets=targets)
+
+        target_ids = {target_id for position_matches in matches for target_id, separation in position_matches}
+        names = dict(Target.objects.filter(pk__in=target_ids).values_list('id', 'name'))
+
+        results = []
+        for (ra, dec), position_matches in zip(positions, matches):
+            results.append({
+                'ra': ra,
+                'dec': dec,
+                'matches': [{'id': target_id, 'name': names[target_id], 'separation': separation * 3600.0}
+                            for target_id, separation in position_matches]
+            })
+
+        return Response({'results': results})
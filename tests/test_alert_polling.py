@@ -0,0 +1,133 @@
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from datetime import timedelta
+import time
+
+from tom_alerts.alerts import GenericAlert
+from tom_alerts.models import BrokerQuery
+from tom_observations.tests.factories import SiderealTargetFactory
+from tom_targets.models import Target
+from agntom.alert_polling import poll_brokers, deduplicate_alerts, PolledAlert
+
+now = timezone.now()
+
+mock_alerts = {
+    'BrokerA': [
+        {'name': 'ZTF23aaaaaaa', 'ra': 150.0, 'dec': 2.0, 'timestamp': now},
+        {'name': 'ZTF23bbbbbbb', 'ra': 210.0, 'dec': -30.0, 'timestamp': now - timedelta(days=30)},
+    ],
+    'BrokerB': [
+        {'name': 'AT2023abc', 'ra': 150.0002, 'dec': 2.0001, 'timestamp': now},
+        {'name': 'AT2023xyz', 'ra': 80.0, 'dec': 10.0, 'timestamp': now},
+    ],
+    'BrokerC': [
+        {'name': 'Gaia23aaa', 'ra': 25.0, 'dec': -5.0, 'timestamp': now},
+    ],
+}
+
+
+class MockBroker:
+    def __init__(self, name):
+        self.name = name
+
+    def fetch_alerts(self, parameters):
+        # Modify the parameters in place, as some of the tom_alerts brokers do
+        parameters['page'] = parameters.get('page', 0) + 1
+        return iter(mock_alerts[self.name])
+
+    def to_generic_alert(self, alert):
+        return GenericAlert(timestamp=alert['timestamp'], url='', id=alert['name'], name=alert['name'],
+                            ra=alert['ra'], dec=alert['dec'], mag=18.0, score=1.0)
+
+    def to_target(self, alert):
+        # Save the Target directly, as the ALeRCE and Lasair brokers do
+        return Target.objects.create(name=alert['name'], type='SIDEREAL', ra=alert['ra'], dec=alert['dec'])
+
+
+class MockTupleBroker(MockBroker):
+    def fetch_alerts(self, parameters):
+        return iter(mock_alerts[self.name]), 'Broker feedback'
+
+
+class MockSlowBroker(MockBroker):
+    def fetch_alerts(self, parameters):
+        time.sleep(2)
+        return iter([])
+
+
+def mock_service_class(name):
+    if name == 'BrokerSlow':
+        return lambda: MockSlowBroker(name)
+    if name == 'BrokerC':
+        return lambda: MockTupleBroker(name)
+    return lambda: MockBroker(name)
+
+
+@patch('agntom.alert_polling.get_service_class', side_effect=mock_service_class)
+class TestAlertPolling(TestCase):
+    def setUp(self):
+        self.query_a = BrokerQuery.objects.create(name='A', broker='BrokerA', parameters={},
+                                                  last_run=now - timedelta(days=1))
+        self.query_b = BrokerQuery.objects.create(name='B', broker='BrokerB', parameters={})
+        self.query_c = BrokerQuery.objects.create(name='C', broker='BrokerC', parameters={})
+
+    def test_poll_brokers(self, patch1):
+        SiderealTargetFactory.create(name='AT2023xyz', ra=80.0, dec=10.0)
+        known_target = SiderealTargetFactory.create(name='NGC-1', ra=25.0001, dec=-5.0)
+
+        queries = list(BrokerQuery.objects.all())
+        summary = poll_brokers(queries=queries)
+
+        # The old alert from BrokerA is behind its cursor, the two alerts
+        # for the same event are merged, the known target is skipped and the
+        # alert at the position of an existing target is added to it
+        self.assertEqual(summary['alerts'], 4)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual([target.name for target in summary['targets']], ['ZTF23aaaaaaa'])
+        self.assertEqual(summary['matched'], [known_target])
+        self.assertIn('Gaia23aaa', known_target.names)
+        self.assertFalse(Target.objects.filter(name='Gaia23aaa').exists())
+        target = Target.objects.get(name='ZTF23aaaaaaa')
+        self.assertIn('AT2023abc', target.names)
+        self.assertFalse(Target.objects.filter(name='ZTF23bbbbbbb').exists())
+
+        self.query_b.refresh_from_db()
+        self.assertIsNotNone(self.query_b.last_run)
+
+        # The saved query parameters are not changed by the brokers
+        self.assertEqual([query.parameters for query in queries], [{}, {}, {}])
+
+        # Re-running the sweep should not create any duplicate targets
+        summary = poll_brokers()
+        self.assertEqual(summary['targets'], [])
+        self.assertEqual(summary['matched'], [])
+
+    def test_broker_timeout(self, patch1):
+        slow_query = BrokerQuery.objects.create(name='Slow', broker='BrokerSlow', parameters={})
+
+        # Only one query runs at a time, so the timeout must apply to each
+        # broker from when it starts rather than to the sweep as a whole
+        start = time.monotonic()
+        summary = poll_brokers(queries=[slow_query, self.query_c], timeout=0.5, max_workers=1)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+        self.assertEqual(summary['timed_out'], [slow_query])
+        self.assertEqual(summary['completed'], [self.query_c])
+        slow_query.refresh_from_db()
+        self.assertIsNone(slow_query.last_run)
+
+    def test_deduplicate_alerts(self, patch1):
+        broker = MockBroker('BrokerA')
+        polled_alerts = []
+        for alert in mock_alerts['BrokerA'] + mock_alerts['BrokerB']:
+            polled_alerts.append(PolledAlert(broker, alert, broker.to_generic_alert(alert), alert['timestamp']))
+
+        groups = deduplicate_alerts(polled_alerts, 2.0, 24.0)
+        self.assertEqual(len(groups), 3)
+        self.assertEqual([p.generic_alert.name for p in groups[0]], ['ZTF23aaaaaaa', 'AT2023abc'])
+
+        # Alerts at the same position but far apart in time are distinct events
+        groups = deduplicate_alerts(polled_alerts[:1] + [polled_alerts[0]._replace(timestamp=now - timedelta(days=5))],
+                                    2.0, 24.0)
+        self.assertEqual(len(groups), 2)
@@ -0,0 +1,186 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+import hashlib
+import os
+import shutil
+import tempfile
+
+from tom_dataproducts.models import DataProduct, data_product_path
+from tom_observations.tests.factories import ObservingRecordFactory, SiderealTargetFactory
+from agntom.archive_sync import sync_archive_data, download_file, find_pending_records
+
+mock_files = {
+    'frame-1.fits.fz': b'frame 1 data' * 100,
+    'frame-2.fits.fz': b'frame 2 data' * 100,
+}
+
+
+class MockFacility:
+    name = 'MockFacility'
+
+    def get_terminal_observing_states(self):
+        return ['COMPLETED', 'CANCELED', 'WINDOW_EXPIRED']
+
+    def get_failed_observing_states(self):
+        return ['CANCELED', 'WINDOW_EXPIRED']
+
+    def data_products(self, observation_id):
+        return [{'id': f'{observation_id}-{filename}', 'filename': filename, 'url': f'https://archive/{filename}',
+                 'md5': hashlib.md5(content).hexdigest()} for filename, content in mock_files.items()]
+
+
+class MockResponse:
+    def __init__(self, content, fail_after=None):
+        self.content = content
+        self.fail_after = fail_after
+        self.headers = {'Content-Length': str(len(content))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.content
+
+    def iter_content(self, chunk_size=1):
+        content = self.content if self.fail_after is None else self.content[:self.fail_after]
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+        if self.fail_after is not None:
+            raise IOError('Connection reset')
+
+
+class MockSession:
+    def __init__(self, fail_after=None):
+        self.downloads = []
+        self.fail_after = fail_after
+
+    def get(self, url, **kwargs):
+        if url.endswith('/frames/'):
+            # LCO archive frames, whose checksums are given in the version_set
+            return MockResponse({'count': len(mock_files), 'next': None, 'results': [
+                {'id': 1000 + i, 'filename': filename, 'url': f'https://archive/{filename}',
+                 'reduction_level': 91, 'version_set': [{'md5': hashlib.md5(content).hexdigest()}]}
+                for i, (filename, content) in enumerate(mock_files.items())
+            ]})
+        self.downloads.append(url)
+        return MockResponse(mock_files[os.path.basename(url)], fail_after=self.fail_after)
+
+
+class TempMediaRootTestCase(TestCase):
+    """
+    Writes downloaded files to a temporary MEDIA_ROOT, which is removed
+    after each test
+    """
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@patch('agntom.archive_sync.get_service_classes', return_value={'MockFacility': MockFacility})
+@patch('agntom.archive_sync.get_service_class', return_value=MockFacility)
+class TestArchiveSync(TempMediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        target = SiderealTargetFactory.create()
+        self.completed = ObservingRecordFactory.create(target_id=target.id, facility='MockFacility',
+                                                       status='COMPLETED')
+        self.expired = ObservingRecordFactory.create(target_id=target.id, facility='MockFacility',
+                                                     status='WINDOW_EXPIRED')
+
+    def test_sync_archive_data(self, patch1, patch2):
+        session = MockSession()
+        with patch('agntom.archive_sync.get_session', return_value=session), \
+                patch('agntom.archive_sync.run_hook') as mock_hook:
+            summary = sync_archive_data(max_workers=4)
+
+        self.assertEqual(summary['records'], 1)
+        self.assertEqual(summary['downloaded'], 2)
+        self.assertEqual(len(session.downloads), 2)
+        self.assertEqual(summary['data_products'], 2)
+        self.assertEqual(mock_hook.call_count, 2)
+        data_products = DataProduct.objects.filter(observation_record=self.completed)
+        self.assertEqual(data_products.count(), 2)
+        self.assertEqual(data_products.first().data_product_type, 'fits_file')
+        for data_product in data_products:
+            with open(data_product.data.path, 'rb') as f:
+                self.assertEqual(f.read(), mock_files[os.path.basename(data_product.data.name)])
+        self.assertFalse(DataProduct.objects.filter(observation_record=self.expired).exists())
+
+        # Re-running does nothing once the record has its data products
+        with patch('agntom.archive_sync.get_session', return_value=session):
+            summary = sync_archive_data()
+        self.assertEqual(summary['records'], 0)
+
+        # Files already on disk with a matching checksum are not downloaded again
+        session = MockSession()
+        data_product = data_products.first()
+        content = mock_files[os.path.basename(data_product.data.name)]
+        with patch('agntom.archive_sync.get_session', return_value=session):
+            downloaded = download_file('https://archive/frame', data_product.data.path,
+                                       checksum=hashlib.md5(content).hexdigest())
+        self.assertFalse(downloaded)
+        self.assertEqual(session.downloads, [])
+
+    def test_interrupted_download(self, patch1, patch2):
+        session = MockSession(fail_after=100)
+        with patch('agntom.archive_sync.get_session', return_value=session):
+            summary = sync_archive_data()
+
+        # No partial files are left behind, and the record is retried next time
+        self.assertEqual(summary['failed'], 2)
+        self.assertEqual(summary['data_products'], 0)
+        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
+            self.assertFalse([f for f in files if f.endswith('.part')])
+        self.assertFalse(DataProduct.objects.exists())
+
+
+class TestArchiveSyncLCO(TempMediaRootTestCase):
+    """
+    Runs the sync against the facilities configured in TOM_FACILITY_CLASSES,
+    with the LCO archive replaced by LCO-shaped frames
+    """
+    def setUp(self):
+        super().setUp()
+        target = SiderealTargetFactory.create()
+        self.completed = ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='COMPLETED')
+        ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='WINDOW_EXPIRED')
+
+    def test_find_pending_records(self):
+        self.assertEqual(find_pending_records(), [self.completed])
+
+    def test_sync_lco_frames(self):
+        session = MockSession()
+        with patch('agntom.archive_sync.get_session', return_value=session):
+            summary = sync_archive_data()
+
+        self.assertEqual(summary['downloaded'], 2)
+        self.assertEqual(summary['data_products'], 2)
+        self.assertEqual(sorted(DataProduct.objects.values_list('product_id', flat=True)), ['1000', '1001'])
+
+    def test_skip_existing_lco_frames(self):
+        # Files already on disk are kept if they match the checksum in the
+        # version_set, and downloaded again if they do not
+        for filename, content in mock_files.items():
+            data_product = DataProduct(target=self.completed.target, observation_record=self.completed)
+            file_path = os.path.join(settings.MEDIA_ROOT, data_product_path(data_product, filename))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as f:
+                f.write(content if filename == 'frame-1.fits.fz' else b'corrupted')
+
+        session = MockSession()
+        with patch('agntom.archive_sync.get_session', return_value=session):
+            summary = sync_archive_data()
+
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['downloaded'], 1)
+        self.assertEqual(session.downloads, ['https://archive/frame-2.fits.fz'])
@@ -0,0 +1,135 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from unittest.mock import patch
+from datetime import datetime, timedelta
+import requests
+import time
+
+from tom_observations.facilities.lco import LCOFacility
+from tom_observations.models import ObservationGroup, DynamicCadence
+from tom_observations.tests.factories import ObservingRecordFactory, SiderealTargetFactory
+from agntom.cadence_strategies import LongBaselineMonitoring
+from agntom.toolbox import lco
+from agntom.toolbox.fake_lco import start_fake_portal
+from tests.test_cadence_strategies import obs_params
+
+request_group = {
+    'name': 'AGN-1_20200101',
+    'proposal': 'LCOSchedulerTest',
+    'ipp_value': 1.05,
+    'operator': 'SINGLE',
+    'observation_type': 'NORMAL',
+    'requests': [{
+        'windows': [{'start': '2020-01-01T00:00:00', 'end': '2020-01-01T23:59:59'}],
+        'configurations': [{'type': 'EXPOSE', 'instrument_type': '1M0-SCICAM-SINISTRO'}],
+    }]
+}
+
+
+class TestFakeLCOPortal(SimpleTestCase):
+    def setUp(self):
+        self.server = start_fake_portal(complete_after=0.1, seed=1)
+        self.headers = {'Authorization': 'Token fake-token'}
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_submit_and_status(self):
+        credentials = {'lco_token': 'fake-token', 'portal_url': self.server.portal_url}
+        response = lco.lco_api(request_group, credentials, 'requestgroups')
+        self.assertEqual(response['state'], 'PENDING')
+        request_id = response['requests'][0]['id']
+
+        url = self.server.portal_url + f'/api/requests/{request_id}'
+        self.assertEqual(requests.get(url, headers=self.headers).json()['state'], 'PENDING')
+        time.sleep(0.2)
+        self.assertEqual(requests.get(url, headers=self.headers).json()['state'], 'COMPLETED')
+
+        response = requests.get(self.server.portal_url + '/api/requestgroups/', headers=self.headers).json()
+        self.assertEqual(response['count'], 1)
+        self.assertEqual(response['results'][0]['state'], 'COMPLETED')
+
+        response = requests.post(self.server.portal_url + '/api/requestgroups/', headers=self.headers,
+                                 json={'name': 'Invalid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_metadata(self):
+        response = requests.get(self.server.portal_url + '/api/instruments/', headers=self.headers).json()
+        self.assertIn('1M0-SCICAM-SINISTRO', response)
+        response = requests.get(self.server.portal_url + '/api/profile/', headers=self.headers).json()
+        self.assertEqual(response['proposals'][0]['id'], 'LCOSchedulerTest')
+
+    def test_fault_injection(self):
+        self.server.portal.rate_limit = 2
+        codes = [requests.get(self.server.portal_url + '/api/profile/', headers=self.headers).status_code
+                 for i in range(4)]
+        self.assertEqual(codes, [200, 200, 429, 429])
+
+        self.server.portal.rate_limit = None
+        self.server.portal.error_rate = 1.0
+        response = requests.get(self.server.portal_url + '/api/profile/', headers=self.headers)
+        self.assertEqual(response.status_code, 500)
+
+
+class TestLCOFacilityWithFakePortal(TestCase):
+    """
+    Drives the TOM's LCOFacility, and the LongBaselineMonitoring cadence
+    strategy, against the stand-in portal with no mocks
+    """
+    def setUp(self):
+        self.server = start_fake_portal(complete_after=0.5, seed=1)
+        self.addCleanup(self.server.shutdown)
+
+        # The LCO facility reads its settings when it is imported, so the
+        # module attributes are pointed at the stand-in portal
+        lco_settings = {'portal_url': self.server.portal_url, 'api_key': 'fake-token'}
+        for name, value in (('PORTAL_URL', self.server.portal_url), ('LCO_SETTINGS', lco_settings)):
+            patcher = patch(f'tom_observations.facilities.lco.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_submit_status_and_cancel(self):
+        facility = LCOFacility()
+        self.assertEqual(facility.validate_observation(request_group), {})
+        observation_ids = facility.submit_observation(request_group)
+        self.assertEqual(len(observation_ids), 1)
+
+        # Submit a second group, so that the request ID lookup used when
+        # cancelling has to pick out the right one
+        other_ids = facility.submit_observation(request_group)
+
+        status = facility.get_observation_status(observation_ids[0])
+        self.assertEqual(status['state'], 'PENDING')
+        self.assertTrue(facility.cancel_observation(other_ids[0]))
+        self.assertEqual(facility.get_observation_status(other_ids[0])['state'], 'CANCELED')
+
+        time.sleep(0.6)
+        self.assertEqual(facility.get_observation_status(observation_ids[0])['state'], 'COMPLETED')
+
+    def test_long_baseline_monitoring(self):
+        target = SiderealTargetFactory.create()
+        params = dict(obs_params)
+        params['target_id'] = target.id
+        params['start'] = (datetime.now() - timedelta(hours=12)).strftime('%Y-%m-%dT%H:%M:%S')
+        params['end'] = (datetime.now() + timedelta(hours=12)).strftime('%Y-%m-%dT%H:%M:%S')
+        record = ObservingRecordFactory.create(target_id=target.id, parameters=params, status='WINDOW_EXPIRED')
+        group = ObservationGroup.objects.create()
+        group.observation_records.add(record)
+        dynamic_cadence = DynamicCadence.objects.create(
+            cadence_strategy='Long Baseline Monitoring',
+            cadence_parameters={'cadence_frequency': 72},
+            active=True,
+            observation_group=group)
+
+        # The form built from the portal's instrument and proposal metadata
+        # must be valid for the new request to be submitted
+        facility = LCOFacility()
+        form = facility.get_form(params['observation_type'])(params)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        LongBaselineMonitoring(dynamic_cadence).run()
+        new_record = group.observation_records.get()
+        self.assertNotEqual(new_record.id, record.id)
+        self.assertIn(int(new_record.observation_id), self.server.portal.requests)
@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import resolve
+
+from tom_observations.tests.factories import SiderealTargetFactory
+from tom_targets.models import Target
+from agntom.models import TargetSkyIndex
+from agntom.sky_index import cone_search, crossmatch, get_zone
+from agntom.views import SkyIndexTargetListView, SkyIndexTargetViewSet
+
+target_positions = {
+    'AGN-1': (359.9995, 10.0),
+    'AGN-2': (0.0005, 10.0),
+    'AGN-3': (150.0, -45.0),
+    'AGN-4': (150.01, -45.0),
+    'AGN-5': (42.0, 89.999),
+}
+
+
+class TestSkyIndex(TestCase):
+    def setUp(self):
+        self.targets = {}
+        for name, (ra, dec) in target_positions.items():
+            self.targets[name] = SiderealTargetFactory.create(name=name, ra=ra, dec=dec)
+
+    def test_index_kept_current(self):
+        target = self.targets['AGN-3']
+        self.assertEqual(target.sky_index.zone, get_zone(-45.0))
+
+        target.dec = 20.0
+        target.save()
+        self.assertEqual(TargetSkyIndex.objects.get(target=target).zone, get_zone(20.0))
+
+        # Targets created without the views, as by the API, imports and
+        # broker queries, are indexed too
+        target = Target.objects.create(name='AGN-6', type='SIDEREAL', ra=10.0, dec=20.0)
+        self.assertTrue(TargetSkyIndex.objects.filter(target=target).exists())
+        target = Target(name='AGN-7', type='SIDEREAL', ra=11.0, dec=21.0)
+        target.save(extras={}, names=[])
+        self.assertTrue(TargetSkyIndex.objects.filter(target=target).exists())
+
+        target.delete()
+        self.assertEqual(TargetSkyIndex.objects.count(), len(target_positions) + 1)
+
+    def test_cone_search(self):
+        # The cone straddles RA=0, so both sides of the wrap must be found
+        found = cone_search(0.0, 10.0, 1.0 / 60.0)
+        self.assertEqual(set(found), {self.targets['AGN-1'].id, self.targets['AGN-2'].id})
+
+        found = cone_search(150.0, -45.0, 5.0 / 3600.0)
+        self.assertEqual(list(found), [self.targets['AGN-3'].id])
+
+        # A cone around the pole includes all RAs
+        found = cone_search(200.0, 90.0, 0.01)
+        self.assertEqual(list(found), [self.targets['AGN-5'].id])
+
+    def test_crossmatch(self):
+        positions = [(150.0001, -45.0), (0.0, 10.0), (300.0, -60.0)]
+        matches = crossmatch(positions, 2.0 / 3600.0)
+
+        self.assertEqual([target_id for target_id, separation in matches[0]], [self.targets['AGN-3'].id])
+        self.assertEqual({target_id for target_id, separation in matches[1]},
+                         {self.targets['AGN-1'].id, self.targets['AGN-2'].id})
+        self.assertEqual(matches[2], [])
+
+        # Restricting the targets excludes the others from the results
+        matches = crossmatch(positions[:1], 60.0 / 3600.0, targets=[self.targets['AGN-4']])
+        self.assertEqual([target_id for target_id, separation in matches[0]], [self.targets['AGN-4'].id])
+
+
+class TestSkyIndexViews(TestCase):
+    def setUp(self):
+        for name, (ra, dec) in target_positions.items():
+            SiderealTargetFactory.create(name=name, ra=ra, dec=dec)
+        user = User.objects.create_superuser(username='test', email='test@example.com', password='test')
+        self.client.force_login(user)
+
+    def test_url_overrides(self):
+        self.assertEqual(resolve('/targets/').func.view_class, SkyIndexTargetListView)
+        self.assertEqual(resolve('/api/targets/').func.cls, SkyIndexTargetViewSet)
+        self.assertEqual(resolve('/api/targets/crossmatch/').func.cls, SkyIndexTargetViewSet)
+
+    def test_target_list_cone_search(self):
+        response = self.client.get('/targets/', {'cone_search': '150.0,-45.0,0.01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(target.name for target in response.context['object_list']), ['AGN-3', 'AGN-4'])
+
+        response = self.client.get('/targets/', {'target_cone_search': 'AGN-1,0.002'})
+        self.assertEqual(sorted(target.name for target in response.context['object_list']), ['AGN-1', 'AGN-2'])
+
+    def test_api_cone_search(self):
+        response = self.client.get('/api/targets/', {'cone_search': '0.0,10.0,0.01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(target['name'] for target in response.json()['results']), ['AGN-1', 'AGN-2'])
+
+    def test_api_crossmatch(self):
+        response = self.client.post('/api/targets/crossmatch/',
+                                    {'radius': 2.0, 'positions': [[150.0001, -45.0], [300.0, -60.0]]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([match['name'] for match in results[0]['matches']], ['AGN-3'])
+        self.assertEqual(results[1]['matches'], [])
+
+        for body in ({'radius': 'nan', 'positions': [[150.0, -45.0]]},
+                     {'radius': -1.0, 'positions': [[150.0, -45.0]]},
+                     {'radius': 2.0, 'positions': [[150.0, 95.0]]},
+                     {'radius': 2.0}):
+            response = self.client.post('/api/targets/crossmatch/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)